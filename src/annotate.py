@@ -14,7 +14,10 @@ from pkg.annotate.cyto import CytoCat, load_cyto_band, attach_cyto_category
 
 
 LOG = logging.getLogger()
-NCI_FORMAT = dict(sep="\t")
+NCI_FORMAT = dict(
+    sep="\t",
+    dtype={"chrom": str, "start": np.int64, "end": np.int64, "score": np.float64},
+)
 
 
 def main(
@@ -36,36 +39,21 @@ def main(
 
     exclude = ["chrX"]
     basic_center, basic_scale = compute_normalizer(
-        nci_cat_table.query("chrom not in @exclude")["score"].values
+        nci_cat_table.loc[~nci_cat_table["chrom"].isin(exclude), "score"].values
     )
 
-    output = open(output_filename, "w")
-    need_header = True
+    nci_cat_tracks = {
+        chrom: track.reset_index(drop=True)
+        for chrom, track in nci_cat_table.groupby("chrom", sort=False)
+    }
 
-    for chain in chains:
-        chrom = chain.chrom
-        nci_cat_track = nci_cat_table.query("chrom == @chrom")
-        chain_length = len(nci_cat_track)
+    tracks = []
 
+    for chain in chains:
+        nci_cat_track = nci_cat_tracks[chain.chrom]
         cats = nci_cat_track["cat"].values
-        tags = [[] for _ in range(chain_length)]
-
-        for i in range(chain_length):
-            match cats[i]:
-                case CytoCat.NOR:
-                    tags[i].append("anor" if chain.activate_nor else "bnor")
-                case CytoCat.CEN:
-                    tags[i].append("cen")
-                case CytoCat.HET:
-                    tags[i].append("het")
-
-        scores = (
-            nci_cat_track["score"]
-            .rolling(window=smooth_window, center=True, min_periods=1)
-            .mean()
-            .values
-        )
-        parameters = np.zeros((chain_length, 2))
+
+        scores = centered_mean(nci_cat_track["score"].values, smooth_window)
 
         match chain.annot_scheme:
             case AnnotScheme.GENOME_WIDE:
@@ -75,19 +63,16 @@ def main(
             case AnnotScheme.ALL_B:
                 center, scale = np.inf, 1
 
-        for i in range(chain_length):
-            z_score = (scores[i] - center) / scale
-            chrom_type = determine_chromatin_type(z_score, tristate, tags[i])
-            # chrom_type = determine_chromatin_type(z_score, tristate, tags[i])
-
-            tags[i].append(CHROM_TYPE_TAGS[chrom_type])
-            parameters[i] = CHROM_TYPE_PARAMETERS[chrom_type]
-            #tags[i].append(CHROM_TYPE_TAGS[chrom_type])
-            parameters[i] = CHROM_TYPE_PARAMETERS[determine_chromatin_type(z_score, tristate)]
+        chrom_types = determine_chromatin_types(
+            (scores - center) / scale,
+            tristate,
+            infer_chromatin_types(cats, chain.activate_nor),
+        )
+        parameters = CHROM_TYPE_PARAMETERS[chrom_types]
 
-            # Remove "het" as it is not used and also might be confusing.
-            if "het" in tags[i]:
-                tags[i].remove("het")
+        cat_tags = make_cat_tags(cats, chain.activate_nor)
+        type_tags = CHROM_TYPE_TAGS[chrom_types]
+        tags = np.where(cat_tags == "", type_tags, cat_tags + "," + type_tags)
 
         track = pd.DataFrame({
             "chain": chain.name,
@@ -95,12 +80,15 @@ def main(
             "end": nci_cat_track["end"].values,
             "A": parameters[:, 0],
             "B": parameters[:, 1],
-            "tags": map(",".join, tags),
+            "tags": tags,
         })
+        tracks.append(track)
 
-        track.to_csv(output, sep="\t", float_format="%g", index=False, header=need_header)
-        need_header = False
-        output.flush()
+    # An empty file is written if there is no chain to annotate.
+    with open(output_filename, "w") as output:
+        if tracks:
+            annotation = pd.concat(tracks, ignore_index=True)
+            annotation.to_csv(output, sep="\t", float_format="%g", index=False)
 
 
 class AnnotScheme(enum.Enum):
@@ -117,29 +105,20 @@ class Chain:
     activate_nor: bool = False
 
 
-class ChromType(enum.Enum):
-    A = 1
-    B = 2
-    U = 3
-
+class ChromType(enum.IntEnum):
+    A = 0
+    B = 1
+    U = 2
 
-CHROM_TYPE_HEURISTICS = {
-    "cen": ChromType.B,
-    "anor": ChromType.A,
-    "bnor": ChromType.B,
-}
 
-CHROM_TYPE_TAGS = {
-    ChromType.A: "A",
-    ChromType.B: "B",
-    ChromType.U: "u",
-}
+# Lookup tables indexed by ChromType.
+CHROM_TYPE_TAGS = np.array(["A", "B", "u"])
 
-CHROM_TYPE_PARAMETERS = {
-    ChromType.A: (1.0, 0.0),
-    ChromType.B: (0.0, 1.0),
-    ChromType.U: (0.5, 0.5),
-}
+CHROM_TYPE_PARAMETERS = np.array([
+    (1.0, 0.0),
+    (0.0, 1.0),
+    (0.5, 0.5),
+])
 
 
 def design_diploid_chains(
@@ -209,31 +188,63 @@ def design_diploid_chains(
     return chains
 
 
-def determine_chromatin_type(z_score: float, tristate: float, tags: list[str]) -> int:
-    if np.isnan(z_score):
-        return infer_chromatin_type(tags)
+def determine_chromatin_types(
+    z_scores: np.ndarray,
+    tristate: float,
+    fallback_types: np.ndarray,
+) -> np.ndarray:
+    types = np.where(
+        z_scores > tristate,
+        ChromType.A,
+        np.where(z_scores < -tristate, ChromType.B, ChromType.U),
+    )
+    # NaN fails both comparisons above. Patch those bins in place.
+    np.copyto(types, fallback_types, where=np.isnan(z_scores))
+    return types
+
 
-    if z_score > tristate:
-        return ChromType.A
-    if z_score < -tristate:
-        return ChromType.B
-    return ChromType.U
+def infer_chromatin_types(cats: np.ndarray, activate_nor: bool) -> np.ndarray:
+    # Heuristic chromatin types used for bins lacking NCI data.
+    types = np.full(len(cats), ChromType.U)
+    types[cats == CytoCat.CEN] = ChromType.B
+    types[cats == CytoCat.NOR] = ChromType.A if activate_nor else ChromType.B
+    return types
 
 
-def infer_chromatin_type(tags: list[str]) -> int:
-    for key, typ in CHROM_TYPE_HEURISTICS.items():
-        if key in tags:
-            return typ
-    return ChromType.U
+def make_cat_tags(cats: np.ndarray, activate_nor: bool) -> np.ndarray:
+    # HET is not tagged as it is not used and also might be confusing.
+    tags = np.full(len(cats), "", dtype=object)
+    tags[cats == CytoCat.CEN] = "cen"
+    tags[cats == CytoCat.NOR] = "anor" if activate_nor else "bnor"
+    return tags
 
 
 def compute_normalizer(values: np.ndarray) -> tuple[float, float]:
     MAD_FACTOR = 1.4826
-    center = np.nanmedian(values)
-    scale = np.nanmedian(np.abs(values - center)) * MAD_FACTOR
+    # Drop NaNs once up front. np.median selects the middle elements with
+    # np.partition, so the medians run in linear time.
+    values = values[~np.isnan(values)]
+    center = np.median(values)
+    scale = np.median(np.abs(values - center)) * MAD_FACTOR
     return center, scale
 
 
+def centered_mean(values: np.ndarray, window: int) -> np.ndarray:
+    # Centered moving average ignoring NaNs. Equivalent to pandas
+    # rolling(window, center=True, min_periods=1).mean() but computed in O(N)
+    # from cumulative sums.
+    valid = ~np.isnan(values)
+    sums = np.concatenate([[0], np.cumsum(np.where(valid, values, 0))])
+    counts = np.concatenate([[0], np.cumsum(valid)])
+
+    indices = np.arange(len(values))
+    lower = np.clip(indices - window // 2, 0, len(values))
+    upper = np.clip(indices - window // 2 + window, 0, len(values))
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (sums[upper] - sums[lower]) / (counts[upper] - counts[lower])
+
+
 def parse_args() -> dict:
     parser = argparse.ArgumentParser()
     parser.add_argument("--tristate", type=float)
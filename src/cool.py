@@ -16,6 +16,7 @@ from pkg.common.cli import invoke_main
 
 LOG = logging.getLogger()
 NUCLEOLAR_CHAIN = "nucleoli"
+CHUNK_SIZE = 1_000_000
 
 
 def main(
@@ -55,11 +56,17 @@ def main(
     bins_end = np.empty(n_bins, dtype=int)
     chains_end = chain_ranges.max()
 
-    for name, (start, end) in zip(chain_names, chain_ranges):
-        indices = np.arange(end - start)
-        bins_chrom[start:end] = name
-        bins_start[start:end] = bin_start_coords[start:end]
-        bins_end[start:end] = bin_end_coords[start:end]
+    chain_starts = chain_ranges[:, 0]
+    chain_lengths = chain_ranges[:, 1] - chain_ranges[:, 0]
+    chain_offsets = np.cumsum(chain_lengths) - chain_lengths
+    indices = (
+        np.arange(chain_lengths.sum())
+        - np.repeat(chain_offsets, chain_lengths)
+        + np.repeat(chain_starts, chain_lengths)
+    )
+    bins_chrom[indices] = np.repeat(np.array(chain_names, dtype=object), chain_lengths)
+    bins_start[indices] = bin_start_coords[indices]
+    bins_end[indices] = bin_end_coords[indices]
 
     indices = np.arange(n_bins - chains_end)
     bins_chrom[chains_end:] = NUCLEOLAR_CHAIN
@@ -83,13 +90,15 @@ def main(
             try:
                 with h5py.File(input_sim, "r") as store:
                     snapshots = store["stages"]["interphase"]
-                    steps = [step.decode() for step in snapshots[".steps"]]
+                    steps = np.array([step.decode() for step in snapshots[".steps"][:]])
 
                     steps_to_use = steps
                     if frames is not None:
-                        steps_to_use = np.concatenate(
-                            [steps[frame_slice] for frame_slice in frames]
-                        )
+                        indices = np.concatenate([
+                            np.arange(*frame_slice.indices(len(steps)))
+                            for frame_slice in frames
+                        ])
+                        steps_to_use = steps[indices]
 
                     for i in tqdm.trange(len(steps_to_use), leave=False):
                         step = steps_to_use[i]
@@ -99,13 +108,17 @@ def main(
                         sample = snapshots[step]
                         if "contacts" not in sample:
                             continue
-                        contacts = sample["contacts"][:]
-
-                        yield {
-                            "bin1_id": contacts[:, 0],
-                            "bin2_id": contacts[:, 1],
-                            "count": contacts[:, 2],
-                        }
+                        contacts = sample["contacts"]
+
+                        # Read in chunks to bound memory usage on large
+                        # samples.
+                        for chunk_start in range(0, len(contacts), CHUNK_SIZE):
+                            chunk = contacts[chunk_start:(chunk_start + CHUNK_SIZE)]
+                            yield {
+                                "bin1_id": chunk[:, 0],
+                                "bin2_id": chunk[:, 1],
+                                "count": chunk[:, 2],
+                            }
             except Exception as ex:
                 LOG.warning(">> Skipping: %s", ex)
 
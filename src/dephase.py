@@ -3,6 +3,7 @@ import logging
 
 import cooler
 import duckdb
+import numpy as np
 import pandas as pd
 import tqdm
 
@@ -33,14 +34,14 @@ def main(
     # Define output bins.
     input_bins = clr.bins()[:]
     output_bins = make_output_bins(input_bins, chrom_copies)
-    chrom_chain_mapping = make_mapping(input_bins, output_bins, chrom_copies)
+    bin_mapping = make_mapping(input_bins, output_bins, chrom_copies)
     LOG.info("Bins reduced: %d -> %d", len(input_bins), len(output_bins))
 
     # Create a cool dataset from incrementally de-phased input contacts.
     cooler.create_cooler(
         output,
         output_bins,
-        dephase_pixels(clr, chrom_chain_mapping, CHUNK_SIZE),
+        dephase_pixels(clr, bin_mapping, CHUNK_SIZE),
         assembly=clr.info.get("genome-assembly"),
     )
 
@@ -54,17 +55,20 @@ def main(
 
 
 def infer_chromosome_copies(chain_names: list[str]) -> dict[str, list[str]]:
-    chrom_copies: dict[str, list[str]] = {}
-
-    for chain_name in chain_names:
-        match chain_name.split(":"):
-            case [chrom, suffix]:
-                if chrom not in chrom_copies:
-                    chrom_copies[chrom] = []
-                chrom_copies[chrom].append(suffix)
-            case _:
-                LOG.warn("Skipping unrecognized chain: %s", chain_name)
-
+    names = pd.Series(chain_names, dtype=object)
+    parts = names.str.split(":")
+    valid = parts.str.len() == 2
+
+    for chain_name in names[~valid]:
+        LOG.warn("Skipping unrecognized chain: %s", chain_name)
+
+    chains = pd.DataFrame(parts[valid].tolist(), columns=["chrom", "suffix"])
+    chrom_copies = (
+        chains
+        .groupby("chrom", sort=False)["suffix"]
+        .agg(list)
+        .to_dict()
+    )
     return chrom_copies
 
 
@@ -89,86 +93,90 @@ def make_mapping(
     input_bins: pd.DataFrame,
     output_bins: pd.DataFrame,
     chrom_copies: dict[str, list[str]],
-) -> pd.DataFrame:
-    chrom_chain_mapping: list[dict] = []
+) -> np.ndarray:
+    # Lookup table from input (diploid) bin ids to output (haploid) bin ids.
+    # Bins not belonging to any chromosome are mapped to -1.
+    bin_mapping = np.full(len(input_bins), -1, dtype=np.int64)
 
-    def chrom_range(bins: pd.DataFrame, name: str) -> tuple[int, int]:
-        indices = bins.query("chrom == @name").index
-        return indices[0], indices[-1] + 1
+    def chrom_ranges(bins: pd.DataFrame) -> dict[str, tuple[int, int]]:
+        groups = bins.groupby("chrom", observed=True, sort=False)
+        return {
+            name: (indices[0], indices[-1] + 1)
+            for name, indices in groups.indices.items()
+        }
+
+    input_ranges = chrom_ranges(input_bins)
+    output_ranges = chrom_ranges(output_bins)
 
     for chrom, suffixes in chrom_copies.items():
-        chrom_start, chrom_end = chrom_range(output_bins, chrom)
+        chrom_start, chrom_end = output_ranges[chrom]
 
         for suffix in suffixes:
             chain = f"{chrom}:{suffix}"
-            chain_start, chain_end = chrom_range(input_bins, chain)
-
-            chrom_chain_mapping.append({
-                "chrom_start": chrom_start,
-                "chrom_end": chrom_end,
-                "chain_start": chain_start,
-                "chain_end": chain_end,
-            })
+            chain_start, chain_end = input_ranges[chain]
+            bin_mapping[chain_start:chain_end] = (
+                chrom_start + np.arange(chain_end - chain_start)
+            )
 
-    return pd.DataFrame.from_records(chrom_chain_mapping)
+    return bin_mapping
 
 
 def dephase_pixels(
     clr: cooler.Cooler,
-    chrom_chain_mapping: pd.DataFrame,
+    bin_mapping: np.ndarray,
     chunk_size: int,
 ):
-    source_pixels = clr.pixels()
-    n_pixels = len(source_pixels)
-
-    LOG.info("Dephasing %d pixels", n_pixels)
-
-    for chunk_start in tqdm.trange(0, n_pixels, chunk_size):
-        chunk_end = min(chunk_start + chunk_size, n_pixels)
-        pixels = source_pixels[chunk_start:chunk_end]
-        pixels = _map_pixels(pixels, chrom_chain_mapping)
-        pixels = _dedupe_pixels(pixels)
-        yield pixels
+    # Read pixel columns directly from the HDF5 datasets so that each chunk
+    # comes as plain NumPy arrays, without constructing a DataFrame.
+    with clr.open("r") as store:
+        source_pixels = store["pixels"]
+        n_pixels = len(source_pixels["bin1_id"])
+
+        LOG.info("Dephasing %d pixels", n_pixels)
+
+        for chunk_start in tqdm.trange(0, n_pixels, chunk_size):
+            chunk = slice(chunk_start, min(chunk_start + chunk_size, n_pixels))
+            pixels = _map_pixels(
+                source_pixels["bin1_id"][chunk],
+                source_pixels["bin2_id"][chunk],
+                source_pixels["count"][chunk],
+                bin_mapping,
+            )
+            pixels = _dedupe_pixels(pixels)
+            yield pixels
 
     # After consuming pixels Cooler merges them into a single cool.
     LOG.info("Merging pixels...")
 
 
 def _map_pixels(
-    pixels: pd.DataFrame,
-    chrom_chain_mapping: pd.DataFrame,
+    bin1_ids: np.ndarray,
+    bin2_ids: np.ndarray,
+    counts: np.ndarray,
+    bin_mapping: np.ndarray,
 ) -> pd.DataFrame:
-    # Map diploid pixel coordinates to haploid ones, using given mapping table.
-    duckdb.execute(
-        """
-        SELECT
-          (bin1_id - m1.chain_start + m1.chrom_start) as bin1_id,
-          (bin2_id - m2.chain_start + m2.chrom_start) as bin2_id,
-          count
-        FROM pixels
-        JOIN chrom_chain_mapping m1 ON
-          bin1_id >= m1.chain_start AND bin1_id < m1.chain_end
-        JOIN chrom_chain_mapping m2 ON
-          bin2_id >= m2.chain_start AND bin2_id < m2.chain_end
-        """
-    )
-    return duckdb.df()
+    # Map diploid pixel coordinates to haploid ones, using given lookup table.
+    # Pixels involving unmapped bins are dropped. The mapped pixels are put in
+    # the upper-triangular format that Cooler expects.
+    bin1_ids = bin_mapping[bin1_ids]
+    bin2_ids = bin_mapping[bin2_ids]
+    valid = (bin1_ids >= 0) & (bin2_ids >= 0)
+    bin1_ids = bin1_ids[valid]
+    bin2_ids = bin2_ids[valid]
+
+    return pd.DataFrame({
+        "bin1_id": np.minimum(bin1_ids, bin2_ids),
+        "bin2_id": np.maximum(bin1_ids, bin2_ids),
+        "count": counts[valid],
+    })
 
 
 def _dedupe_pixels(pixels: pd.DataFrame) -> pd.DataFrame:
-    # Merge superposed pixels and output the results in the upper-triangular
-    # format that Cooler expects.
+    # Merge superposed pixels.
     duckdb.execute(
         """
-        WITH triu_pixels AS (
-            SELECT
-                 least(bin1_id, bin2_id) as bin1_id,
-              greatest(bin1_id, bin2_id) as bin2_id,
-              count
-            FROM pixels
-        )
         SELECT bin1_id, bin2_id, sum(count)::INTEGER as count
-        FROM triu_pixels
+        FROM pixels
         GROUP BY bin1_id, bin2_id
         ORDER BY bin1_id, bin2_id
         """
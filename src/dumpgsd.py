@@ -16,6 +16,7 @@ LOG = logging.getLogger()
 GSD_SCHEMA = dict(application="", schema="hoomd", schema_version=(1, 0))
 DEFAULT_BOX = (100, 100, 100)
 DIMENSION = 3
+ID_DTYPE = np.uint32
 
 
 def main(
@@ -46,24 +47,26 @@ def main(
 
 
 class ParticlesData(typing.NamedTuple):
-    type_ids: list[int]
+    type_ids: np.ndarray
     type_names: list[str]
 
 
 class BondsData(typing.NamedTuple):
-    pairs: list[tuple[int]]
-    type_ids: list[int]
+    pairs: np.ndarray
+    type_ids: np.ndarray
     type_names: list[str]
 
 
 class TopologyMod:
     def derive_extra_particles(self, metadata: h5py.Group, next_id: int) -> ParticlesData:
-        return ParticlesData([], [])
+        return ParticlesData(np.empty(0, dtype=ID_DTYPE), [])
 
     def derive_extra_bonds(self, metadata: h5py.Group, next_id: int) -> BondsData:
-        return BondsData([], [], [])
+        return BondsData(
+            np.empty((0, 2), dtype=ID_DTYPE), np.empty(0, dtype=ID_DTYPE), []
+        )
 
-    def derive_extra_positions(self, snapshot: h5py.Group) -> np.ndarray:
+    def derive_extra_positions(self) -> np.ndarray:
         return np.zeros(shape=(0, DIMENSION))
 
 
@@ -73,29 +76,33 @@ class AnaphaseMod(TopologyMod):
 
     def derive_extra_particles(self, metadata: h5py.Group, next_id: int) -> ParticlesData:
         return ParticlesData(
-            type_ids=[next_id],
+            type_ids=np.array([next_id], dtype=ID_DTYPE),
             type_names=["spindle_pole"],
         )
 
     def derive_extra_bonds(self, metadata: h5py.Group, next_id: int) -> BondsData:
         pole_index = len(metadata["particle_types"])
-        pairs = [(i, pole_index) for i in metadata["kinetochore_beads"]]
+        kinetochore_beads = metadata["kinetochore_beads"][:]
+        pairs = np.column_stack([
+            kinetochore_beads,
+            np.full(len(kinetochore_beads), pole_index),
+        ])
         return BondsData(
-            pairs=pairs,
-            type_ids=([next_id] * len(pairs)),
+            pairs=pairs.astype(ID_DTYPE),
+            type_ids=np.full(len(pairs), next_id, dtype=ID_DTYPE),
             type_names=["microtubule"],
         )
 
-    def derive_extra_positions(self, snapshot: h5py.Group) -> np.ndarray:
+    def derive_extra_positions(self) -> np.ndarray:
         return np.reshape(self._pole_position, (1, DIMENSION))
 
 
 class InterphaseMod(TopologyMod):
     def derive_extra_bonds(self, metadata: h5py.Group, next_id: int) -> BondsData:
-        nucleolar_bonds = [(i, j) for i, j in metadata["nucleolar_bonds"]]
+        nucleolar_bonds = metadata["nucleolar_bonds"][:]
         return BondsData(
-            pairs=nucleolar_bonds,
-            type_ids=([next_id] * len(nucleolar_bonds)),
+            pairs=nucleolar_bonds.astype(ID_DTYPE),
+            type_ids=np.full(len(nucleolar_bonds), next_id, dtype=ID_DTYPE),
             type_names=["nucleolus"],
         )
 
@@ -106,7 +113,7 @@ class PrometaphaseMod(TopologyMod):
 
     def derive_extra_particles(self, metadata: h5py.Group, next_id: int) -> ParticlesData:
         return ParticlesData(
-            type_ids=[next_id, next_id],
+            type_ids=np.array([next_id, next_id], dtype=ID_DTYPE),
             type_names=["spindle_pole"],
         )
 
@@ -114,19 +121,21 @@ class PrometaphaseMod(TopologyMod):
         pole_index_a = len(metadata["particle_types"])
         pole_index_b = pole_index_a + 1
         kinetochore_beads = metadata["kinetochore_beads"][:]
+        sister_chromatids = metadata["sister_chromatids"][:]
 
-        pairs = []
-        for chromatid_a, chromatid_b in metadata["sister_chromatids"]:
-            pairs.append((kinetochore_beads[chromatid_a], pole_index_a))
-            pairs.append((kinetochore_beads[chromatid_b], pole_index_b))
+        # Bond each sister pair to the opposite poles, interleaving the pairs
+        # as (chromatid_a, pole_a), (chromatid_b, pole_b), ...
+        sister_beads = np.reshape(kinetochore_beads[sister_chromatids], (-1, 2))
+        poles = np.broadcast_to([pole_index_a, pole_index_b], sister_beads.shape)
+        pairs = np.stack([sister_beads, poles], axis=-1).reshape(-1, 2)
 
         return BondsData(
-            pairs=pairs,
-            type_ids=([next_id] * len(pairs)),
+            pairs=pairs.astype(ID_DTYPE),
+            type_ids=np.full(len(pairs), next_id, dtype=ID_DTYPE),
             type_names=["microtubule"],
         )
 
-    def derive_extra_positions(self, snapshot: h5py.Group) -> np.ndarray:
+    def derive_extra_positions(self) -> np.ndarray:
         return self._pole_positions
 
 
@@ -138,28 +147,35 @@ def dump_trajectory(
     metadata = store["metadata"]
     particles = derive_particles(metadata, topology_mod)
     bonds = derive_bonds(metadata, topology_mod)
-    box_shape = DEFAULT_BOX
-
-    # Dump all snapshots.
-    for step in store[".steps"]:
-        snapshot = store[step]
-
-        stored_positions = snapshot["positions"][:]
-        extra_positions = topology_mod.derive_extra_positions(snapshot)
-        positions = np.concatenate([stored_positions, extra_positions])
-
-        frame_data = FrameData(
-            step=int(step),
-            box_shape=box_shape,
-            particle_types=particles.type_ids,
-            particle_type_names=particles.type_names,
-            particle_positions=positions,
-            particle_attributes={},
-            bond_types=bonds.type_ids,
-            bond_type_names=bonds.type_names,
-            bond_pairs=bonds.pairs,
-        )
-        traj.append(make_hoomd_frame(frame_data))
+
+    # Topology is the same across snapshots. Build a frame once and reuse it
+    # for all snapshots, only updating the step and the particle positions.
+    # Positions are read into a buffer reused across snapshots. Extra particles
+    # defined by the topology mod occupy the tail, which is static.
+    n_stored = len(metadata["particle_types"])
+    positions = np.empty((len(particles.type_ids), DIMENSION), dtype=np.float32)
+    positions[n_stored:] = topology_mod.derive_extra_positions()
+
+    frame = make_hoomd_frame(FrameData(
+        step=0,
+        box_shape=DEFAULT_BOX,
+        particle_types=particles.type_ids,
+        particle_type_names=particles.type_names,
+        particle_positions=positions,
+        particle_attributes={},
+        bond_types=bonds.type_ids,
+        bond_type_names=bonds.type_names,
+        bond_pairs=bonds.pairs,
+    ))
+
+    # Dump all snapshots. Iterating over the .steps dataset itself would issue
+    # one HDF5 read per step, so the step names are read at once.
+    for step in store[".steps"][:]:
+        store[step]["positions"].read_direct(positions, dest_sel=np.s_[:n_stored])
+
+        frame.configuration.step = int(step)
+        frame.particles.position = positions
+        traj.append(frame)
 
 
 def derive_particles(metadata: h5py.Group, topology_mod: TopologyMod) -> ParticlesData:
@@ -174,7 +190,9 @@ def derive_particles(metadata: h5py.Group, topology_mod: TopologyMod) -> Particl
     extra_particles = topology_mod.derive_extra_particles(metadata, next_id=len(stored_type_names))
 
     return ParticlesData(
-        type_ids=(list(stored_types) + extra_particles.type_ids),
+        type_ids=np.concatenate([
+            stored_types.astype(ID_DTYPE), extra_particles.type_ids
+        ]),
         type_names=(stored_type_names + extra_particles.type_names),
     )
 
@@ -182,24 +200,31 @@ def derive_particles(metadata: h5py.Group, topology_mod: TopologyMod) -> Particl
 def derive_bonds(metadata: h5py.Group, topology_mod: TopologyMod) -> BondsData:
     chain_ranges = metadata["chain_ranges"][:]
 
-    stored_pairs = sum(
-        (define_linear_bonds(start, end) for start, end in chain_ranges),
-        [],
-    )
-    stored_type_ids = [0] * len(stored_pairs)
+    stored_pairs = define_chain_bonds(chain_ranges).astype(ID_DTYPE)
+    stored_type_ids = np.zeros(len(stored_pairs), dtype=ID_DTYPE)
     stored_type_names = ["chrom"]
 
     extra_bonds = topology_mod.derive_extra_bonds(metadata, next_id=len(stored_type_names))
 
     return BondsData(
-        pairs=(stored_pairs + extra_bonds.pairs),
-        type_ids=(stored_type_ids + extra_bonds.type_ids),
+        pairs=np.concatenate([stored_pairs, extra_bonds.pairs]),
+        type_ids=np.concatenate([stored_type_ids, extra_bonds.type_ids]),
         type_names=(stored_type_names + extra_bonds.type_names),
     )
 
 
-def define_linear_bonds(start: int, end: int) -> list[tuple[int, int]]:
-    return list(zip(range(start, end - 1), range(start + 1, end)))
+def define_chain_bonds(chain_ranges: np.ndarray) -> np.ndarray:
+    # Bonds (i, i+1) between adjacent particles in all the chains, computed
+    # at once without looping over chains.
+    starts = chain_ranges[:, 0]
+    bond_counts = np.maximum(chain_ranges[:, 1] - starts - 1, 0)
+    bond_offsets = np.cumsum(bond_counts) - bond_counts
+    indices = (
+        np.arange(bond_counts.sum())
+        - np.repeat(bond_offsets, bond_counts)
+        + np.repeat(starts, bond_counts)
+    )
+    return np.column_stack([indices, indices + 1])
 
 
 class FrameData(typing.NamedTuple):
@@ -248,8 +273,7 @@ def make_hoomd_frame(data: FrameData) -> gsd.hoomd.Frame:
     for key, values in data.particle_attributes.items():
         frame.log[f"particles/{key}"] = values
 
-    frame.validate()
-
+    # Not validating here: HOOMDTrajectory.append validates the frame anyway.
     return frame
 
 
@@ -3,11 +3,12 @@ import logging
 import os
 import signal
 
-import cooler
+import pandas as pd
 
 from pkg.common.args import remove_none
 from pkg.common.cli import invoke_main
-from pkg.nci import make_nci_track
+from pkg.common.h5 import open_cooler
+from pkg.nci import make_nci_track_from_matrix
 
 
 LOG = logging.getLogger()
@@ -27,22 +28,30 @@ def main(
         input_dataset += f"::/resolutions/{input_binsize}"
 
     LOG.info("Opening %s", input_dataset)
-    cool = cooler.Cooler(input_dataset)
-
-    LOG.info("Writing to %s", output_filename)
-    with open(output_filename, "w") as output:
-        output_format = determine_format(output_filename)
-        need_header = True
-        for chrom in cool.chromnames:
+    with open_cooler(input_dataset) as cool:
+        # No balancing is needed as NCI is invariant under multiplicative bias.
+        # The selector and bin metadata are looked up once for all chromosomes.
+        matrix = cool.matrix()
+        bins = cool.bins()[:]
+        extents = {chrom: cool.extent(chrom) for chrom in cool.chromnames}
+
+        tracks = []
+        for chrom, extent in extents.items():
             if chrom in exclude:
                 continue
 
             LOG.info("Computing NCI on %s", chrom)
-            track = make_nci_track(cool, chrom, halve=True)
-            track.to_csv(output, index=False, header=need_header, **output_format)
-            need_header = False
+            track = make_nci_track_from_matrix(matrix, bins, chrom, extent, halve=True)
+            tracks.append(track)
 
-            output.flush()
+    # An empty file is written if all chromosomes are excluded.
+    LOG.info("Writing to %s", output_filename)
+    with open(output_filename, "w") as output:
+        if tracks:
+            output_format = determine_format(output_filename)
+            pd.concat(tracks, ignore_index=True).to_csv(
+                output, index=False, **output_format
+            )
 
 
 def determine_format(filename: str) -> dict:
@@ -1,9 +1,9 @@
 import argparse
+import functools
 import json
 import logging
 import typing
 
-import cooler
 import numpy as np
 import pandas as pd
 import tqdm
@@ -11,10 +11,14 @@ import tqdm
 
 from pkg.common.args import remove_none
 from pkg.common.cli import invoke_main
-from pkg.pc1.math import power_svd
+from pkg.common.h5 import open_cooler
+from pkg.pc1.math import (
+    SVDStep, column_moments, merge_moments, power_svd, randomized_svd
+)
 
 
 LOG = logging.getLogger()
+RANDOMIZED_SVD_MAX_STEPS = 50
 MATRIX_FORMAT = dict(dtype=np.float32, order="C")
 OUTPUT_FORMAT = dict(sep="\t", float_format="%g", na_rep="nan", index=False)
 
@@ -27,70 +31,81 @@ def main(
     mask_intra: bool = False,
     use_covariance: bool = False,
     use_raw: bool = False,
+    use_randomized_svd: bool = False,
+    svd_tolerance: float = 1e-4,
 ):
     LOG.info("Opening cooler dataset %s", cool)
-    clr = cooler.Cooler(cool)
-    bins = clr.bins()[:]
-    matrix = clr.matrix(balance=(not use_raw))
-
-    LOG.info("Loading contact matrix of shape %s", matrix.shape)
-    contact_matrix = np.asarray(matrix[:, :], **MATRIX_FORMAT)
-    chrom_ranges = {chrom: clr.extent(chrom) for chrom in clr.chromnames}
-
-    # Transform to O/E matrix in place.
-    LOG.info("Computing O/E matrix")
-    expected = estimate_expected_contacts(contact_matrix, chrom_ranges)
-    data_matrix = contact_matrix
-    del contact_matrix
-
-    for patch in scan_chrom_rows(data_matrix, chrom_ranges):
-        patch.trans_1[...] /= expected.inter
-        patch.trans_2[...] /= expected.inter
-
-        if mask_intra:
-            # Leaving bad entries as-is
-            patch.cis[np.isfinite(patch.cis)] = 1
-        else:
-            cis_size = len(patch.cis)
-            for k in range(-cis_size + 1, cis_size):
-                diag = np.diagonal(patch.cis, k)
-                diag.setflags(write=True) # https://github.com/numpy/numpy/issues/5407
-                diag[:] /= expected.intra[abs(k)]
-
-    # Center columns for PCA
+    with open_cooler(cool) as clr:
+        bins = clr.bins()[:]
+        matrix = clr.matrix(balance=(not use_raw))
+        chrom_ranges = {chrom: clr.extent(chrom) for chrom in clr.chromnames}
+
+        # The contact matrix is loaded chromosome by chromosome in each of the
+        # passes below, so that the full dense matrix is never held in memory.
+        LOG.info("Estimating expected contacts of matrix of shape %s", matrix.shape)
+        expected = estimate_expected_contacts(matrix, chrom_ranges)
+
+        def scan_oe_rows():
+            for patch in scan_chrom_rows(matrix, chrom_ranges):
+                transform_to_oe(patch, expected, mask_intra=mask_intra)
+                yield patch
+
+        # Center columns for PCA
+        LOG.info("Computing O/E column statistics")
+        moments = functools.reduce(
+            merge_moments, (column_moments(patch.rows) for patch in scan_oe_rows())
+        )
+        coverages = moments.mean * moments.count
+        selection = coverages > 0
+        data_dim = selection.sum()
+
+        LOG.info("Loading O/E matrix")
+        data_matrix = np.empty((len(selection), data_dim), **MATRIX_FORMAT)
+        for patch in scan_oe_rows():
+            start, end = chrom_ranges[patch.chrom]
+            data_matrix[start:end] = patch.rows[:, selection]
+
     LOG.info("Standardizing columns")
-    coverages = np.nansum(data_matrix, axis=0)
-    selection = coverages > 0
-    data_matrix = data_matrix[:, selection]
-    data_dim = data_matrix.shape[1]
 
-    data_matrix[...] -= np.nanmean(data_matrix, axis=0)
+    # Variances of the columns after standardization, which are used later.
+    # These are derived from the moments without rescanning the matrix.
+    column_vars = moments.variance[selection]
+
+    data_matrix[...] -= moments.mean[selection]
     if not use_covariance:
-        data_matrix[...] /= np.nanstd(data_matrix, axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            data_matrix[...] /= np.sqrt(column_vars)
+
+        # Standardized columns have unit variance, or NaN where the std was 0.
+        column_vars = np.where(column_vars > 0, 1.0, np.nan)
 
     LOG.info(">> Found %d valid bins out of %d", data_dim, data_matrix.shape[0])
 
     # SVD
     LOG.info("Running SVD")
-    progress = tqdm.tqdm(desc="SVD")
-    delta_tol = 1e-4
-
-    for svd in power_svd(data_matrix):
-        progress.update()
-        progress.set_postfix(delta=svd.delta)
-        if svd.delta < delta_tol:
-            break
-
-    progress.close()
+    if use_randomized_svd:
+        svd = run_svd(
+            randomized_svd(data_matrix), svd_tolerance, RANDOMIZED_SVD_MAX_STEPS
+        )
+        if svd.delta >= svd_tolerance:
+            LOG.warning(
+                "Randomized SVD did not converge in %d steps; continuing with"
+                " power iteration",
+                svd.step,
+            )
+            svd = run_svd(power_svd(data_matrix, init=svd.vector), svd_tolerance)
+    else:
+        svd = run_svd(power_svd(data_matrix), svd_tolerance)
+    svd_vector = svd.vector
 
     #
     LOG.info("Computing PC1")
-    pc1 = data_matrix @ svd.vector
-    ev1 = unselect_vector(svd.vector, selection)
+    pc1 = data_matrix @ svd_vector
+    ev1 = unselect_vector(svd_vector, selection)
 
     # pc1 is multiplied by the first singular value. Rescale PC1 so that the
     # variance of pc1 gives the EVR, for convenience.
-    data_var = np.nansum(np.nanvar(data_matrix, axis=0))
+    data_var = np.nansum(column_vars)
     pc1[:] /= np.sqrt(data_var)
     evr = np.nanvar(pc1)
 
@@ -117,14 +132,30 @@ def main(
             json.dump(aux_data, file)
 
 
+def run_svd(
+    svd_steps: typing.Iterator[SVDStep],
+    delta_tol: float,
+    max_steps: int | None = None,
+) -> SVDStep:
+    progress = tqdm.tqdm(desc="SVD")
+
+    for svd in svd_steps:
+        progress.update()
+        progress.set_postfix(delta=svd.delta)
+        if svd.delta < delta_tol or svd.step == max_steps:
+            break
+
+    progress.close()
+    return svd
+
+
 def unselect_vector(
     vector: np.ndarray,
     selection: np.ndarray,
     placeholder: float = np.nan,
 ) -> np.ndarray:
     result = np.full(len(selection), placeholder, dtype=vector.dtype)
-    indices = np.arange(len(result))[selection]
-    result[indices] = vector
+    result[selection] = vector
     return result
 
 
@@ -136,9 +167,11 @@ class ContactPatch(typing.NamedTuple):
     cis: np.ndarray
 
 
-def scan_chrom_rows(contact_matrix: np.ndarray, chrom_ranges: dict):
+def scan_chrom_rows(contact_matrix, chrom_ranges: dict):
+    # contact_matrix may be an array or a cooler matrix selector. In the
+    # latter case rows are fetched from the cooler one chromosome at a time.
     for chrom, (start, end) in chrom_ranges.items():
-        rows = contact_matrix[start:end]
+        rows = np.asarray(contact_matrix[start:end, :], **MATRIX_FORMAT)
         yield ContactPatch(
             chrom=chrom,
             rows=rows,
@@ -148,21 +181,49 @@ def scan_chrom_rows(contact_matrix: np.ndarray, chrom_ranges: dict):
         )
 
 
+def transform_to_oe(
+    patch: ContactPatch,
+    expected: "ExpectedContacts",
+    *,
+    mask_intra: bool = False,
+):
+    # Divisors are cast to the matrix dtype so that the divisions run in
+    # single precision without promoting the operands.
+    dtype = patch.rows.dtype
+    inter = dtype.type(expected.inter)
+    patch.trans_1[...] /= inter
+    patch.trans_2[...] /= inter
+
+    if mask_intra:
+        # Leaving bad entries as-is
+        patch.cis[np.isfinite(patch.cis)] = 1
+    else:
+        patch.cis[...] /= make_decay_divisor(expected.intra, len(patch.cis), dtype)
+
+
+def make_decay_divisor(profile: np.ndarray, size: int, dtype) -> np.ndarray:
+    # Returns a size x size Toeplitz matrix with profile[|j - i|] at (i, j),
+    # as a strided read-only view of the mirrored profile (no n x n buffer).
+    profile = profile[:size].astype(dtype, copy=False)
+    mirrored = np.concatenate([profile[:0:-1], profile])
+    return np.lib.stride_tricks.sliding_window_view(mirrored, size)[::-1]
+
+
 class ExpectedContacts(typing.NamedTuple):
     intra: np.ndarray
     inter: float
 
 
 def estimate_expected_contacts(
-    contact_matrix: np.ndarray,
+    contact_matrix,
     chrom_ranges: dict,
 ) -> ExpectedContacts:
     max_separation = max(end - start for start, end in chrom_ranges.values())
 
     inter_sum = 0.0
     inter_count = 0
-    intra_sums = np.zeros(max_separation, dtype=contact_matrix.dtype)
-    intra_counts = np.zeros(max_separation, dtype=contact_matrix.dtype)
+    intra_sums = np.zeros(max_separation, dtype=MATRIX_FORMAT["dtype"])
+    intra_counts = np.zeros(max_separation, dtype=MATRIX_FORMAT["dtype"])
 
     for patch in scan_chrom_rows(contact_matrix, chrom_ranges):
         sum_1, count_1 = valid_sum(patch.trans_1)
@@ -170,11 +231,16 @@ def estimate_expected_contacts(
         inter_sum += sum_1 + sum_2
         inter_count += count_1 + count_2
 
-        for s in range(len(patch.cis)):
-            diag = np.diag(patch.cis, s)
-            d_sum, d_count = valid_sum(diag)
-            intra_sums[s] += d_sum
-            intra_counts[s] += d_count
+        # Sum up valid contacts along each upper diagonal, all at once.
+        cis_size = len(patch.cis)
+        separations = make_separations(cis_size)
+        valid = (separations >= 0) & np.isfinite(patch.cis)
+        intra_sums[:cis_size] += np.bincount(
+            separations[valid], weights=patch.cis[valid], minlength=cis_size
+        )
+        intra_counts[:cis_size] += np.bincount(
+            separations[valid], minlength=cis_size
+        )
 
     with np.errstate(invalid="ignore", divide="ignore"):
         return ExpectedContacts(
@@ -183,6 +249,12 @@ def estimate_expected_contacts(
         )
 
 
+def make_separations(size: int) -> np.ndarray:
+    # Signed separation j - i for each (i, j) entry of a square block.
+    indices = np.arange(size)
+    return indices[None, :] - indices[:, None]
+
+
 def valid_sum(vec: np.ndarray) -> (float, int):
     valid = np.isfinite(vec)
     return vec[valid].sum(), valid.sum()
@@ -201,6 +273,12 @@ def parse_args() -> dict:
         default=None,
         help="Convergence threshold used in SVD calculation",
     )
+    arg(
+        "--use-randomized-svd",
+        action="store_true",
+        default=False,
+        help="Use randomized subspace iteration instead of power iteration",
+    )
     arg(
         "--use-raw",
         action="store_true",
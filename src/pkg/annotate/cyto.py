@@ -1,7 +1,6 @@
 import enum
 import logging
 
-import duckdb
 import numpy as np
 import pandas as pd
 
@@ -32,21 +31,8 @@ def attach_cyto_category(
     band_table: pd.DataFrame,
     extend_nor: bool = False,
 ) -> pd.DataFrame:
-    nci_cat_table = nci_table.reset_index()
-
-    with duckdb.connect(":memory:") as con:
-        con.execute(
-            """
-            SELECT b.stain
-            FROM nci_cat_table n
-            LEFT JOIN band_table b ON
-              n.chrom = b.chrom and
-              n.start >= b.start and
-              n.end <= b.end
-            ORDER BY n.index
-            """
-        )
-        stains = [value for value, in con.fetchall()]
+    nci_cat_table = nci_table.reset_index(drop=True)
+    stains = find_containing_stains(nci_cat_table, band_table)
 
     stain_to_cat = {
         "gpos25": CytoCat.HET,
@@ -59,11 +45,10 @@ def attach_cyto_category(
         "stalk": CytoCat.NOR,
     }
 
-    nci_cat_table.drop("index", axis=1, inplace=True)
     nci_cat_table.insert(
         len(nci_cat_table.columns),
         "cat",
-        [stain_to_cat.get(stain, CytoCat.NONE) for stain in stains],
+        pd.Series(stains).map(stain_to_cat).fillna(CytoCat.NONE).values,
     )
 
     for chrom, track in nci_cat_table.groupby("chrom", sort=False):
@@ -79,25 +64,42 @@ def attach_cyto_category(
     return nci_cat_table
 
 
-def do_extend_nor(table: pd.DataFrame) -> pd.DataFrame:
-    new_cats = []
+def find_containing_stains(
+    nci_table: pd.DataFrame,
+    band_table: pd.DataFrame,
+) -> np.ndarray:
+    # Looks up the stain of the band containing each NCI bin, or None if no
+    # band contains the bin. Bands on a chromosome do not overlap, so the only
+    # candidate is the last band starting at or before the bin.
+    stains = np.full(len(nci_table), None, dtype=object)
+    band_groups = band_table.groupby("chrom", sort=False)
+
+    for chrom, indices in nci_table.groupby("chrom", sort=False).indices.items():
+        if chrom not in band_groups.groups:
+            continue
+        bands = band_groups.get_group(chrom).sort_values("start")
+        band_ends = bands["end"].values
+        starts = nci_table["start"].values[indices]
+        ends = nci_table["end"].values[indices]
 
-    for chrom, track in table.groupby("chrom", sort=False):
-        cats = track["cat"].values
-        seen_nor = False
-        arm_end = len(cats)
+        candidates = np.searchsorted(bands["start"].values, starts, side="right") - 1
+        found = candidates >= 0
+        found &= ends <= band_ends[np.maximum(candidates, 0)]
+        stains[indices[found]] = bands["stain"].values[candidates[found]]
 
-        for i, cat in enumerate(cats):
-            if cat == CytoCat.NOR:
-                seen_nor = True
-            if cat == CytoCat.CEN:
-                arm_end = i
-                break
+    return stains
+
+
+def do_extend_nor(table: pd.DataFrame) -> pd.DataFrame:
+    # Extends NOR on a chromosome to the whole arm before the centromere.
+    cats = table["cat"].values.copy()
 
-        if seen_nor:
-            cats = cats.copy()
-            cats[:arm_end] = CytoCat.NOR
+    for indices in table.groupby("chrom", sort=False).indices.values():
+        chrom_cats = cats[indices]
+        centromeres = np.flatnonzero(chrom_cats == CytoCat.CEN)
+        arm_end = centromeres[0] if len(centromeres) else len(chrom_cats)
 
-        new_cats.append(cats)
+        if (chrom_cats[:arm_end] == CytoCat.NOR).any():
+            cats[indices[:arm_end]] = CytoCat.NOR
 
-    return table.assign(cat=np.concatenate(new_cats))
+    return table.assign(cat=cats)
@@ -0,0 +1,41 @@
+import contextlib
+import typing
+
+import cooler
+import h5py
+import numpy as np
+
+
+# Chunks of each pixel dataset kept in the HDF5 raw-data chunk cache. Matrix
+# queries read consecutive ranges of pixels, so the chunk at the end of one
+# query is read again at the start of the next one.
+CACHED_PIXEL_CHUNKS = 4
+
+# Default size of the HDF5 raw-data chunk cache (per dataset).
+DEFAULT_CHUNK_CACHE_SIZE = 1024 * 1024
+
+
+@contextlib.contextmanager
+def open_cooler(uri: str) -> typing.Iterator[cooler.Cooler]:
+    """
+    Opens a cooler dataset (`path` or `path::group`) on a single HDF5 handle
+    whose chunk cache fits a few chunks of the pixel datasets. The handle is
+    shared by all queries made on the returned cooler.
+    """
+    filename, group = cooler.util.parse_cooler_uri(uri)
+    with h5py.File(filename, "r") as store:
+        cache_size = pixel_chunk_cache_size(store[group])
+
+    with h5py.File(filename, "r", rdcc_nbytes=cache_size) as store:
+        yield cooler.Cooler(store[group])
+
+
+def pixel_chunk_cache_size(group: h5py.Group) -> int:
+    chunk_sizes = [
+        dataset.dtype.itemsize * int(np.prod(dataset.chunks))
+        for dataset in group["pixels"].values()
+        if dataset.chunks
+    ]
+    return max([DEFAULT_CHUNK_CACHE_SIZE] + [
+        CACHED_PIXEL_CHUNKS * size for size in chunk_sizes
+    ])
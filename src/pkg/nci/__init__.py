@@ -1 +1 @@
-from .nci import compute_nci, make_nci_track
+from .nci import compute_nci, make_nci_track, make_nci_track_from_matrix
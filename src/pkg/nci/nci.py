@@ -13,23 +13,25 @@ def compute_nci(
     *,
     chunk_size: int = DEFAULT_CHUNK_SIZE,
 ) -> np.ndarray:
-    chunk_ncis = [np.empty(0)]
+    nci = np.empty(max(end - start - 1, 0))
 
     for offset in range(start, end, chunk_size):
         # Must extend the end of the chunk (if it is not the last one) so that
         # the bin pair lying between the next chunk is handled.
         chunk_slice = slice(offset, min(offset + chunk_size + 1, end))
         chunk = matrix[chunk_slice, chunk_slice]
-        diag = np.diag(chunk)
-        sub = np.diag(chunk, 1)
+        diag = np.diagonal(chunk)
+        sub = np.diagonal(chunk, 1)
 
         # Allow NaNs at zero-read sites.
         with np.errstate(divide="ignore", invalid="ignore"):
-            nci = sub / np.sqrt(diag[1:] * diag[:-1])
+            np.divide(
+                sub,
+                np.sqrt(diag[1:] * diag[:-1]),
+                out=nci[(offset - start):(offset - start + len(sub))],
+            )
 
-        chunk_ncis.append(nci)
-
-    return np.concatenate(chunk_ncis)
+    return nci
 
 
 def make_nci_track(
@@ -39,21 +41,44 @@ def make_nci_track(
     halve: bool = False,
     chunk_size: int = DEFAULT_CHUNK_SIZE,
 ) -> pd.DataFrame:
+    # No balancing is needed as NCI is invariant under multiplicative bias.
+    return make_nci_track_from_matrix(
+        cool.matrix(),
+        cool.bins(),
+        chrom,
+        cool.extent(chrom),
+        halve=halve,
+        chunk_size=chunk_size,
+    )
+
+
+def make_nci_track_from_matrix(
+    matrix,
+    bins,
+    chrom: str,
+    extent: tuple[int, int],
+    *,
+    halve: bool = False,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> pd.DataFrame:
+    """
+    Computes the NCI track of a chromosome. `matrix` is a contact matrix
+    selector, `bins` is the whole bin table (or a bin selector) and `extent`
+    is the range of bins on the chromosome. Use this instead of
+    make_nci_track to look these up once for many chromosomes.
+    """
     def make_track(start, end, score):
         return pd.DataFrame(
             {"chrom": chrom, "start": start, "end": end, "score": score}
         )
 
-    # No balancing is needed as NCI is invariant under multiplicative bias.
-    cool_matrix = cool.matrix()
-    cool_bins = cool.bins()
-    chrom_start, chrom_end = cool.extent(chrom)
+    chrom_start, chrom_end = extent
 
     if chrom_start == chrom_end:
-        return make_track([], [], [])
+        return make_track(np.empty(0, dtype=int), np.empty(0, dtype=int), np.empty(0))
 
-    bins = cool_bins[chrom_start:chrom_end]
-    nci = compute_nci(cool_matrix, chrom_start, chrom_end, chunk_size=chunk_size)
+    bins = bins[chrom_start:chrom_end]
+    nci = compute_nci(matrix, chrom_start, chrom_end, chunk_size=chunk_size)
     assert len(nci) == len(bins) - 1
 
     # NCI at the i-th position characterizes the coalesced region spanning
@@ -68,28 +93,25 @@ def make_nci_track(
     #     V           *
     #
     if len(nci) > 0:
-        track = make_track(
-            start=bins["start"].values[:-1],
-            end=bins["end"].values[1:],
-            score=nci,
-        )
+        starts = bins["start"].values[:-1]
+        ends = bins["end"].values[1:]
+        scores = nci
     else:
-        track = make_track(
-            start=bins["start"],
-            end=bins["end"],
-            score=np.nan,
-        )
+        starts = bins["start"].values
+        ends = bins["end"].values
+        scores = np.full(len(bins), np.nan)
 
-    # Drop even rows so that the output has no overlapping bins.
+    # Drop even rows so that the output has no overlapping bins. The last
+    # row is kept, trimmed to the part not covered by the previous row.
     if halve:
-        halved_track = track[::2]
+        rows = np.arange(0, len(starts), 2)
+        if len(starts) % 2 == 0:
+            rows = np.append(rows, len(starts) - 1)
 
-        if len(track) % 2 == 0:
-            remains = track[-1:]
-            prev_end = track.at[track.index[-2], "end"]
-            remains.at[remains.index[0], "start"] = prev_end
-            halved_track = pd.concat([halved_track, remains], ignore_index=True)
+        halved_starts = starts[rows]
+        if len(starts) % 2 == 0:
+            halved_starts[-1] = ends[-2]
 
-        track = halved_track
+        starts, ends, scores = halved_starts, ends[rows], scores[rows]
 
-    return track
+    return make_track(start=starts, end=ends, score=scores)
@@ -3,6 +3,9 @@ import typing
 import numpy as np
 
 
+DEFAULT_BLOCK_SIZE = 256
+
+
 class SVDStep(typing.NamedTuple):
     step: int
     vector: np.ndarray
@@ -17,7 +20,7 @@ def power_svd(
     Iteratively computes the first right singular vector of the given matrix.
     """
     step = 0
-    prev_vec = init or _svd_init(data)
+    prev_vec = _svd_init(data) if init is None else init
     while True:
         vec = _svd_iter(data, prev_vec)
         step += 1
@@ -30,8 +33,138 @@ def _svd_init(data: np.ndarray) -> np.ndarray:
     return np.ones(data_dim, dtype=data.dtype) / np.sqrt(data_dim)
 
 
-def _svd_iter(data: np.ndarray, vec: np.ndarray) -> np.ndarray:
-    weights = data @ vec
-    new_vec = np.nansum(weights[:, None] * data, axis=0)
+def _svd_iter(
+    data: np.ndarray,
+    vec: np.ndarray,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+) -> np.ndarray:
+    # Computes data.T @ (data @ vec) over rows without NaN. Rows containing
+    # NaN get NaN weights and are skipped. Processing rows in blocks avoids
+    # a temporary as large as the data matrix.
+    new_vec = np.zeros_like(vec)
+
+    for start in range(0, len(data), block_size):
+        block = data[start:(start + block_size)]
+        weights = block @ vec
+        valid = ~np.isnan(weights)
+        if valid.all():
+            new_vec += weights @ block
+        else:
+            new_vec += weights[valid] @ block[valid]
+
     new_vec /= np.linalg.norm(new_vec)
     return new_vec
+
+
+def randomized_svd(
+    data: np.ndarray,
+    oversample: int = 10,
+    seed: int = 0,
+) -> typing.Iterator[SVDStep]:
+    """
+    Iteratively computes the first right singular vector of the given matrix
+    by randomized subspace iteration (Halko et al.), yielding the Ritz vector
+    at each step. Rows containing NaN are skipped as in power_svd.
+    """
+    rng = np.random.default_rng(seed)
+    data_dim = data.shape[1]
+    basis = rng.standard_normal((data_dim, min(1 + oversample, data_dim)))
+    basis = _orthonormalize(basis.astype(data.dtype))
+
+    step = 0
+    prev_vec = _svd_init(data)
+    while True:
+        product = _gram_product(data, basis)
+
+        # Rayleigh-Ritz on the current subspace.
+        projection = basis.T @ product
+        _, eigvecs = np.linalg.eigh(projection.astype(np.float64))
+        vec = basis @ eigvecs[:, -1].astype(data.dtype)
+        vec /= np.linalg.norm(vec)
+
+        # Fix the sign to match power_svd, which starts from the ones vector.
+        if vec.sum() < 0:
+            vec = -vec
+
+        step += 1
+        yield SVDStep(step=step, vector=vec, delta=np.abs(vec - prev_vec).max())
+        prev_vec = vec
+        basis = _orthonormalize(product)
+
+
+def _orthonormalize(basis: np.ndarray) -> np.ndarray:
+    q, _ = np.linalg.qr(basis.astype(np.float64))
+    return q.astype(basis.dtype)
+
+
+def _gram_product(
+    data: np.ndarray,
+    basis: np.ndarray,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+) -> np.ndarray:
+    # Computes data.T @ (data @ basis) over rows without NaN, like _svd_iter.
+    result = np.zeros_like(basis)
+
+    for start in range(0, len(data), block_size):
+        block = data[start:(start + block_size)]
+        weights = block @ basis
+        valid = ~np.isnan(weights).any(axis=1)
+        if valid.all():
+            result += block.T @ weights
+        else:
+            result += block[valid].T @ weights[valid]
+
+    return result
+
+
+class ColumnMoments(typing.NamedTuple):
+    count: np.ndarray
+    mean: np.ndarray
+    m2: np.ndarray
+
+    @property
+    def variance(self) -> np.ndarray:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self.m2 / self.count
+
+
+def column_moments(
+    data: np.ndarray,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+) -> ColumnMoments:
+    """
+    Computes the NaN-ignoring count, mean and sum of squared deviations of
+    each column in a single pass over the rows of the given matrix.
+    """
+    moments = ColumnMoments(
+        count=np.zeros(data.shape[1], dtype=np.int64),
+        mean=np.zeros(data.shape[1]),
+        m2=np.zeros(data.shape[1]),
+    )
+    for start in range(0, len(data), block_size):
+        block = data[start:(start + block_size)]
+        moments = merge_moments(moments, _block_moments(block))
+    return moments
+
+
+def merge_moments(a: ColumnMoments, b: ColumnMoments) -> ColumnMoments:
+    """
+    Combines the moments of two disjoint sets of rows (Chan et al.).
+    """
+    count = a.count + b.count
+    ratio = np.divide(b.count, count, out=np.zeros(len(count)), where=(count > 0))
+    delta = b.mean - a.mean
+    return ColumnMoments(
+        count=count,
+        mean=(a.mean + delta * ratio),
+        m2=(a.m2 + b.m2 + delta**2 * a.count * ratio),
+    )
+
+
+def _block_moments(block: np.ndarray) -> ColumnMoments:
+    valid = ~np.isnan(block)
+    count = valid.sum(axis=0)
+    total = np.where(valid, block, 0).sum(axis=0, dtype=np.float64)
+    mean = np.divide(total, count, out=np.zeros(len(count)), where=(count > 0))
+    m2 = (np.where(valid, block - mean, 0) ** 2).sum(axis=0, dtype=np.float64)
+    return ColumnMoments(count=count, mean=mean, m2=m2)